@@ -6,8 +6,14 @@ Environment variable-based API key validation for production deployments.
 No file-based storage to avoid restart issues on free hosting platforms.
 """
 
-import os
-from typing import Optional
+import hmac
+import logging
+import time
+from typing import Dict, Optional
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
 
 
 class ProductionAPIKeyManager:
@@ -18,14 +24,17 @@ class ProductionAPIKeyManager:
     file-based storage gets reset on every restart.
     """
     
+    # Successful validations are remembered for this many seconds
+    CACHE_TTL = 30.0
+    CACHE_MAX_ENTRIES = 1024
+    
     def __init__(self):
         """Initialize with environment variable API key."""
         # Primary API key from environment
-        self.primary_key = os.environ.get("VIDEO_ANALYZER_API_KEY")
+        self.primary_key = settings().primary_key
         
         # Fallback keys for backward compatibility (comma-separated)
-        fallback_keys = os.environ.get("FALLBACK_API_KEYS", "")
-        self.fallback_keys = [key.strip() for key in fallback_keys.split(",") if key.strip()]
+        self.fallback_keys = list(settings().fallback_keys)
         
         # Valid keys list
         self.valid_keys = []
@@ -33,7 +42,13 @@ class ProductionAPIKeyManager:
             self.valid_keys.append(self.primary_key)
         self.valid_keys.extend(self.fallback_keys)
         
-        print(f"API Key Manager initialized with {len(self.valid_keys)} valid keys")
+        # Hash-based O(1) prefilter; hits are then verified in constant time
+        self._valid_set = frozenset(self.valid_keys)
+        
+        # Recently validated key -> expiry (monotonic seconds)
+        self._cache: Dict[str, float] = {}
+        
+        logger.info("API Key Manager initialized with %d valid keys", len(self.valid_keys))
     
     def validate_key(self, api_key: str) -> bool:
         """
@@ -46,18 +61,25 @@ class ProductionAPIKeyManager:
             True if key is valid, False otherwise
         """
         if not api_key:
-            print(f"[API Key] No API key provided")
             return False
         
-        # Debug logging
-        print(f"[API Key] Validating key: {api_key[:20]}...")
-        print(f"[API Key] Valid keys count: {len(self.valid_keys)}")
-        if self.valid_keys:
-            print(f"[API Key] First valid key: {self.valid_keys[0][:20]}...")
+        now = time.monotonic()
+        expires = self._cache.get(api_key)
+        if expires is not None and expires > now:
+            return True
+        
+        # Cheap set probe first, then constant-time comparison on a hit
+        is_valid = api_key in self._valid_set and any(
+            hmac.compare_digest(api_key.encode(), key.encode()) for key in self.valid_keys
+        )
+        
+        if is_valid:
+            if len(self._cache) >= self.CACHE_MAX_ENTRIES:
+                self._cache.clear()
+            self._cache[api_key] = now + self.CACHE_TTL
         
-        # Check against all valid keys
-        is_valid = api_key in self.valid_keys
-        print(f"[API Key] Validation result: {is_valid}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[API Key] Validation result: %s", is_valid)
         return is_valid
     
     def get_primary_key(self) -> Optional[str]:
@@ -6,11 +6,11 @@ Helps deploy to free platforms and get API keys.
 """
 
 import subprocess
-import sys
-import json
 import requests
 import time
-from pathlib import Path
+
+# Shared session so health polls and API calls reuse the same connection
+session = requests.Session()
 
 def check_git_repo():
     """Check if we're in a git repository."""
@@ -78,18 +78,22 @@ def generate_api_key(base_url):
     try:
         # Wait for app to be ready
         print("Waiting for app to be ready...")
-        for i in range(30):  # Wait up to 30 seconds
+        deadline = time.monotonic() + 30  # Wait up to 30 seconds
+        delay = 0.2
+        while time.monotonic() < deadline:
             try:
-                response = requests.get(f"{base_url}/health", timeout=5)
+                response = session.get(f"{base_url}/health", timeout=5)
                 if response.status_code == 200:
                     break
             except:
                 pass
-            time.sleep(1)
+            # Exponential backoff: fast when the app is up, fewer polls when it is slow
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+            delay = min(delay * 2, 5.0)
             print(".", end="", flush=True)
         
         print("\nGenerating API key...")
-        response = requests.post(
+        response = session.post(
             f"{base_url}/api-key/generate",
             json={"name": "deployment-key"},
             timeout=10
@@ -127,7 +131,7 @@ def test_api_key(base_url, api_key):
     
     try:
         headers = {"X-API-Key": api_key}
-        response = requests.get(f"{base_url}/api-key/info", headers=headers, timeout=10)
+        response = session.get(f"{base_url}/api-key/info", headers=headers, timeout=10)
         
         if response.status_code == 200:
             print("✅ API key is working!")
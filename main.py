@@ -5,21 +5,28 @@ FastAPI Application for Visual Behavior Analysis System
 Provides REST API endpoints for real-time behavior analysis from video frames.
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Header, Depends, Security
+from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import APIKeyHeader
 from pydantic import BaseModel
-from typing import Optional
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+from typing import Any, Callable, Dict, Optional, Union
+import anyio
+import anyio.to_thread
 import cv2
 import numpy as np
 import base64
-import io
-from PIL import Image
+import os
+import threading
 import time
 
 from production_ready_analyzer import ProductionBehaviorAnalyzer, ProductionConfig
-from api_keys import get_key_manager, ProductionAPIKeyManager
+from api_keys import get_key_manager
+from settings import settings
+
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -28,45 +35,148 @@ app = FastAPI(
     version="1.0.0"
 )
 
-# Enable CORS for frontend integration
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Initialize analyzer
 config = ProductionConfig()
 analyzer = ProductionBehaviorAnalyzer(config)
 
+# The analyzer keeps per-stream state (frame count, smoothing, calibration),
+# so frames are processed one at a time even though decoding runs in parallel
+analyzer_lock = threading.Lock()
+
+# Dedicated worker limit for decode + analysis, sized to the CPU count. Kept
+# separate from the default threadpool, which Starlette also uses for upload I/O
+analysis_limiter = anyio.CapacityLimiter(os.cpu_count() or 1)
+
 # Initialize API key manager
 key_manager = get_key_manager()
 
-# API Key security
+# Key configuration is fixed at startup, so the status body is built once
+_primary_key = key_manager.get_primary_key()
+API_KEY_STATUS = {
+    "keys_configured": key_manager.has_valid_keys(),
+    "key_count": key_manager.get_key_count(),
+    "primary_key_set": _primary_key is not None,
+    "primary_key_prefix": _primary_key[:20] + "..." if _primary_key else None,
+    "message": "API keys are loaded from environment variables" if key_manager.has_valid_keys() else "No API keys configured in environment"
+}
+API_KEY_STATUS_HEADERS = {"Cache-Control": "public, max-age=60"}
+
+# Upload limits for /analyze/frame; the request limit leaves room for multipart framing
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+MAX_UPLOAD_REQUEST_BYTES = MAX_UPLOAD_BYTES + 64 * 1024
+UPLOAD_PATHS = frozenset({"/analyze/frame"})
+
+# API Key security (documented in OpenAPI, enforced by APIKeyMiddleware)
 api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+PROTECTED_PATH_PREFIX = "/analyze/"
+PUBLIC_PATHS = frozenset({"/analyze/detailed"})
+
+
+def requires_api_key(path: str) -> bool:
+    """Check whether a request path is behind API key authentication."""
+    return path.startswith(PROTECTED_PATH_PREFIX) and path not in PUBLIC_PATHS
+
+
+def _content_length(headers: Headers) -> Optional[int]:
+    """Parse the Content-Length header, or None if missing or malformed."""
+    try:
+        return int(headers["content-length"])
+    except (KeyError, ValueError):
+        return None
 
 
-async def verify_api_key(api_key: Optional[str] = Security(api_key_header)):
+class UploadLimitMiddleware:
     """
-    Verify API key from request header.
+    Reject uploads whose Content-Length exceeds MAX_UPLOAD_REQUEST_BYTES.
+    
+    Runs before the multipart body is read and spooled, so oversized uploads
+    are turned away without being ingested.
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"] in UPLOAD_PATHS:
+            content_length = _content_length(Headers(scope=scope))
+            if content_length is not None and content_length > MAX_UPLOAD_REQUEST_BYTES:
+                response = JSONResponse(status_code=413, content={"detail": "Uploaded image is too large"})
+                await response(scope, receive, send)
+                return
+        
+        await self.app(scope, receive, send)
+
+
+class APIKeyMiddleware:
+    """
+    Verify API key from request header on /analyze/* routes.
     
     API key should be sent in header: X-API-Key: your_api_key_here
+    Plain ASGI middleware so other routes (health checks, docs) are passed
+    straight through without any per-request wrapping.
     """
-    if not api_key:
-        raise HTTPException(
-            status_code=401,
-            detail="API key required. Please provide X-API-Key header."
-        )
     
-    if not key_manager.validate_key(api_key):
-        raise HTTPException(
-            status_code=401,
-            detail="Invalid or expired API key."
-        )
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and requires_api_key(scope["path"]):
+            api_key = Headers(scope=scope).get(api_key_header.model.name)
+            if not api_key:
+                detail = "API key required. Please provide X-API-Key header."
+            elif not key_manager.validate_key(api_key):
+                detail = "Invalid or expired API key."
+            else:
+                detail = None
+            
+            if detail is not None:
+                response = JSONResponse(status_code=401, content={"detail": detail})
+                await response(scope, receive, send)
+                return
+        
+        await self.app(scope, receive, send)
+
+
+# Middleware added later wraps earlier ones: API keys are checked before
+# upload size, and CORS (added last) wraps both and answers preflights
+app.add_middleware(UploadLimitMiddleware)
+app.add_middleware(APIKeyMiddleware)
+
+# Enable CORS for frontend integration
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+def custom_openapi() -> Dict[str, Any]:
+    """OpenAPI schema with the X-API-Key scheme attached to protected routes."""
+    if app.openapi_schema:
+        return app.openapi_schema
+    
+    schema = get_openapi(
+        title=app.title,
+        version=app.version,
+        description=app.description,
+        routes=app.routes,
+    )
+    scheme_name = api_key_header.scheme_name
+    schema.setdefault("components", {}).setdefault("securitySchemes", {})[scheme_name] = (
+        api_key_header.model.model_dump(mode="json", by_alias=True, exclude_none=True)
+    )
+    for path, operations in schema.get("paths", {}).items():
+        if requires_api_key(path):
+            for operation in operations.values():
+                operation["security"] = [{scheme_name: []}]
     
-    return api_key
+    app.openapi_schema = schema
+    return schema
+
+
+app.openapi = custom_openapi
 
 
 class FrameAnalysisResponse(BaseModel):
@@ -91,37 +201,117 @@ class HealthResponse(BaseModel):
     timestamp: float
 
 
+async def read_upload(file: UploadFile) -> bytes:
+    """
+    Read an uploaded file, rejecting files over MAX_UPLOAD_BYTES.
+    
+    Requests with a Content-Length are already bounded before parsing. Chunked
+    requests have been spooled in full by the time this runs, so the check
+    here only keeps them from being read back and decoded.
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail="Uploaded image is too large")
+    return await file.read()
+
+
 def decode_image(image_data: bytes) -> np.ndarray:
-    """Decode image bytes to numpy array."""
+    """Decode image bytes to a BGR numpy array."""
     try:
-        # Try to decode as image
-        image = Image.open(io.BytesIO(image_data))
-        # Convert to RGB if needed
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        # Convert to numpy array
-        frame = np.array(image)
-        # Convert RGB to BGR for OpenCV
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        return frame
+        # imdecode returns BGR directly, no intermediate RGB copy
+        frame = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image format: {str(e)}")
+    if frame is None:
+        raise HTTPException(status_code=400, detail="Invalid image format")
+    return frame
 
 
-def decode_base64_image(base64_string: str) -> np.ndarray:
-    """Decode base64 string to numpy array."""
+def decode_base64_image(base64_string: Union[str, bytes], data_url: Optional[bool] = None) -> np.ndarray:
+    """
+    Decode base64 string to numpy array.
+    
+    Accepts str or bytes; callers that already hold bytes skip an encode step.
+    data_url controls the "data:...;base64," prefix: False decodes the payload
+    as-is without scanning for it, True requires it and strips it (rejecting
+    payloads without one), and None (default) strips it only if present.
+    """
     try:
-        # Remove data URL prefix if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
+        payload = base64_string
+        if data_url is not False:
+            # Remove data URL prefix
+            separator = b',' if isinstance(base64_string, bytes) else ','
+            _, sep, rest = base64_string.partition(separator)
+            if sep:
+                payload = rest
+            elif data_url is True:
+                raise ValueError("expected a data URL prefix")
         
         # Decode base64
-        image_data = base64.b64decode(base64_string)
+        image_data = base64.b64decode(payload, validate=False)
         return decode_image(image_data)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid base64 image: {str(e)}")
 
 
+def analyze_image(decode: Callable[..., np.ndarray], *args: Any) -> Dict[str, Any]:
+    """
+    Decode an image payload and run it through the analyzer.
+    
+    CPU-bound; run on a worker thread under analysis_limiter to keep the
+    event loop free.
+    """
+    frame = decode(*args)
+    with analyzer_lock:
+        return analyzer.process_frame(frame)
+
+
+def _round_or_none(value: Optional[float], ndigits: int) -> Optional[float]:
+    """Round a metric value, passing through missing metrics."""
+    return None if value is None else round(value, ndigits)
+
+
+def _build_response(result: Dict[str, Any]) -> FrameAnalysisResponse:
+    """
+    Build the API response from an analyzer result.
+    
+    Uses model_construct, which skips pydantic validation: the values are
+    trusted output of our own analyzer, and the endpoint's response_model does
+    not re-validate an instance of the same model on serialization.
+    """
+    # Extract metrics
+    metrics = result.get('metrics') or {}
+    attention = metrics.get('attention_percent')
+    head_movement = metrics.get('head_movement_normalized')
+    shoulder_tilt = metrics.get('shoulder_tilt_deg')
+    hand_activity = metrics.get('hand_activity_normalized')
+    frame_confidence = result.get('frame_confidence', 0.0)
+    
+    # Determine confidence status
+    confidence_status = "PASS" if frame_confidence >= 0.3 else "FAIL"
+    
+    # Get hand count
+    hands_detected = result.get('detection_results', {}).get('hands_detected_count', 0)
+    
+    # The analyzer stamps every result, so only read the clock as a fallback
+    timestamp = result.get('timestamp')
+    if timestamp is None:
+        timestamp = time.time()
+    
+    return FrameAnalysisResponse.model_construct(
+        frame=result.get('frame_count', 0),
+        frame_confidence=round(frame_confidence, 3),
+        confidence_status=confidence_status,
+        attention=_round_or_none(attention, 1),
+        head_movement=_round_or_none(head_movement, 4),
+        shoulder_tilt=_round_or_none(shoulder_tilt, 1),
+        hand_activity=_round_or_none(hand_activity, 4),
+        hands_detected=hands_detected,
+        timestamp=timestamp,
+        success=True,
+        warnings=result.get('warnings', [])
+    )
+
+
 @app.get("/", response_model=HealthResponse)
 async def root():
     """Root endpoint - health check."""
@@ -148,19 +338,12 @@ async def get_api_key_status():
     Get API key configuration status (no authentication required).
     Useful for debugging deployment issues.
     """
-    return {
-        "keys_configured": key_manager.has_valid_keys(),
-        "key_count": key_manager.get_key_count(),
-        "primary_key_set": key_manager.get_primary_key() is not None,
-        "primary_key_prefix": key_manager.get_primary_key()[:20] + "..." if key_manager.get_primary_key() else None,
-        "message": "API keys are loaded from environment variables" if key_manager.has_valid_keys() else "No API keys configured in environment"
-    }
+    return JSONResponse(content=API_KEY_STATUS, headers=API_KEY_STATUS_HEADERS)
 
 
 @app.post("/analyze/frame", response_model=FrameAnalysisResponse)
 async def analyze_frame(
-    file: UploadFile = File(...),
-    api_key: str = Depends(verify_api_key)
+    file: UploadFile = File(...)
 ):
     """
     Analyze a single frame from uploaded image file.
@@ -170,54 +353,31 @@ async def analyze_frame(
     """
     try:
         # Read image file
-        image_data = await file.read()
-        
-        # Decode image
-        frame = decode_image(image_data)
-        
-        # Process frame
-        result = analyzer.process_frame(frame)
-        
-        # Extract metrics
-        metrics = result.get('metrics', {})
-        frame_confidence = result.get('frame_confidence', 0.0)
-        
-        # Determine confidence status
-        confidence_status = "PASS" if frame_confidence >= 0.3 else "FAIL"
-        
-        # Get hand count
-        hands_detected = result.get('detection_results', {}).get('hands_detected_count', 0)
+        image_data = await read_upload(file)
         
-        # Build response
-        response = FrameAnalysisResponse(
-            frame=result.get('frame_count', 0),
-            frame_confidence=round(frame_confidence, 3),
-            confidence_status=confidence_status,
-            attention=round(metrics.get('attention_percent'), 1) if metrics.get('attention_percent') is not None else None,
-            head_movement=round(metrics.get('head_movement_normalized'), 4) if metrics.get('head_movement_normalized') is not None else None,
-            shoulder_tilt=round(metrics.get('shoulder_tilt_deg'), 1) if metrics.get('shoulder_tilt_deg') is not None else None,
-            hand_activity=round(metrics.get('hand_activity_normalized'), 4) if metrics.get('hand_activity_normalized') is not None else None,
-            hands_detected=hands_detected,
-            timestamp=result.get('timestamp', time.time()),
-            success=True,
-            warnings=result.get('warnings', [])
+        # Decode and process frame off the event loop
+        result = await anyio.to_thread.run_sync(
+            analyze_image, decode_image, image_data, limiter=analysis_limiter
         )
+        return _build_response(result)
         
-        return response
-        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing frame: {str(e)}")
 
 
 @app.post("/analyze/base64", response_model=FrameAnalysisResponse)
 async def analyze_base64_frame(
-    request: dict,
-    api_key: str = Depends(verify_api_key)
+    request: dict
 ):
     """
     Analyze a single frame from base64 encoded image.
     
-    Request body: {"image": "base64_string"}
+    Request body: {"image": "base64_string", "data_url": false}
+    Set "data_url" to false when the image has no "data:...;base64," prefix to
+    skip prefix detection, true to require one; omit it to auto-detect. Clients that can send the raw
+    file should prefer /analyze/frame, which avoids base64 entirely.
     Returns: Behavioral metrics
     """
     try:
@@ -225,39 +385,15 @@ async def analyze_base64_frame(
         base64_string = request.get('image')
         if not base64_string:
             raise HTTPException(status_code=400, detail="Missing 'image' field in request")
+        data_url = request.get('data_url')
+        if data_url is not None and not isinstance(data_url, bool):
+            raise HTTPException(status_code=400, detail="'data_url' must be a boolean")
         
-        # Decode base64 image
-        frame = decode_base64_image(base64_string)
-        
-        # Process frame
-        result = analyzer.process_frame(frame)
-        
-        # Extract metrics
-        metrics = result.get('metrics', {})
-        frame_confidence = result.get('frame_confidence', 0.0)
-        
-        # Determine confidence status
-        confidence_status = "PASS" if frame_confidence >= 0.3 else "FAIL"
-        
-        # Get hand count
-        hands_detected = result.get('detection_results', {}).get('hands_detected_count', 0)
-        
-        # Build response
-        response = FrameAnalysisResponse(
-            frame=result.get('frame_count', 0),
-            frame_confidence=round(frame_confidence, 3),
-            confidence_status=confidence_status,
-            attention=round(metrics.get('attention_percent'), 1) if metrics.get('attention_percent') is not None else None,
-            head_movement=round(metrics.get('head_movement_normalized'), 4) if metrics.get('head_movement_normalized') is not None else None,
-            shoulder_tilt=round(metrics.get('shoulder_tilt_deg'), 1) if metrics.get('shoulder_tilt_deg') is not None else None,
-            hand_activity=round(metrics.get('hand_activity_normalized'), 4) if metrics.get('hand_activity_normalized') is not None else None,
-            hands_detected=hands_detected,
-            timestamp=result.get('timestamp', time.time()),
-            success=True,
-            warnings=result.get('warnings', [])
+        # Decode base64 image and process frame off the event loop
+        result = await anyio.to_thread.run_sync(
+            analyze_image, decode_base64_image, base64_string, data_url, limiter=analysis_limiter
         )
-        
-        return response
+        return _build_response(result)
         
     except HTTPException:
         raise
@@ -283,16 +419,12 @@ async def get_detailed_analysis():
 
 if __name__ == "__main__":
     import uvicorn
-    import os
     import sys
     
-    # Get PORT from environment, default to 8000
-    # This handles Railway's PORT variable correctly
-    try:
-        port = int(os.environ.get("PORT", 8000))
-    except (ValueError, TypeError):
-        port = 8000
+    # PORT from environment (default 8000), handles Railway's PORT variable
+    port = settings().port
     
-    # Start uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    # Start uvicorn on uvloop + httptools; uvloop is unavailable on Windows
+    loop = "asyncio" if sys.platform == "win32" else "uvloop"
+    uvicorn.run(app, host="0.0.0.0", port=port, loop=loop, http="httptools", workers=1)
 
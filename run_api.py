@@ -40,9 +40,9 @@ if __name__ == "__main__":
     print("   All /analyze/* endpoints require X-API-Key header")
     print("\nPress Ctrl+C to stop the server\n")
     
-    import os
-    port = int(os.environ.get("PORT", 8000))
-    reload = os.environ.get("ENV", "development") == "development"
+    from settings import settings
+    port = settings().port
+    reload = settings().environment == "development"
     
     uvicorn.run(
         "main:app",
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Process Settings
+
+Environment variables are read once per process and cached, since they do
+not change while the server is running.
+"""
+
+import functools
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+
+DEFAULT_PORT = 8000
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Immutable snapshot of the environment-driven configuration."""
+    port: int
+    primary_key: Optional[str]
+    fallback_keys: Tuple[str, ...]
+    environment: str
+
+
+def _parse_port(value: Optional[str]) -> int:
+    """Parse PORT, falling back to the default on missing or bad values."""
+    try:
+        return int(value) if value else DEFAULT_PORT
+    except (ValueError, TypeError):
+        return DEFAULT_PORT
+
+
+@functools.lru_cache(maxsize=1)
+def settings() -> Settings:
+    """Get the cached process settings."""
+    fallback_keys = os.environ.get("FALLBACK_API_KEYS", "")
+    return Settings(
+        port=_parse_port(os.environ.get("PORT")),
+        primary_key=os.environ.get("VIDEO_ANALYZER_API_KEY"),
+        fallback_keys=tuple(key.strip() for key in fallback_keys.split(",") if key.strip()),
+        environment=os.environ.get("ENV", "development"),
+    )
@@ -4,10 +4,11 @@ Startup script for Railway deployment
 Reads PORT from environment and starts uvicorn
 """
 import os
-import sys
+
+from settings import settings
 
 # Get PORT from environment, default to 8000
-port = int(os.environ.get("PORT", 8000))
+port = settings().port
 
 # Start uvicorn
 # Use os.execvp to replace current process
@@ -15,6 +16,8 @@ os.execvp("uvicorn", [
     "uvicorn",
     "main:app",
     "--host", "0.0.0.0",
-    "--port", str(port)
+    "--port", str(port),
+    "--loop", "uvloop",
+    "--http", "httptools"
 ])
 
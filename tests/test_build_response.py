@@ -0,0 +1,47 @@
+"""Tests for the analyze endpoints' response building."""
+
+import pytest
+
+from main import FrameAnalysisResponse, _build_response
+
+
+NOMINAL_RESULT = {
+    'frame_count': 7,
+    'frame_confidence': 0.81234,
+    'metrics': {
+        'attention_percent': 55.55,
+        'head_movement_normalized': 0.012345,
+        'shoulder_tilt_deg': 3.14159,
+        'hand_activity_normalized': 0.123456,
+    },
+    'detection_results': {'hands_detected_count': 2},
+    'timestamp': 1700000000.5,
+    'warnings': ['low light'],
+}
+
+
+@pytest.mark.parametrize("result", [
+    NOMINAL_RESULT,
+    {**NOMINAL_RESULT, 'frame_confidence': 0.1, 'metrics': {}, 'warnings': []},
+    {'frame_count': 1, 'frame_confidence': 0.5, 'metrics': None, 'timestamp': 1.0},
+])
+def test_build_response_matches_validated_model(result):
+    built = _build_response(result)
+    validated = FrameAnalysisResponse.model_validate(built.model_dump())
+    
+    assert built.model_dump() == validated.model_dump()
+    assert built.model_fields_set == validated.model_fields_set
+
+
+def test_build_response_rounds_and_passes_through_missing_metrics():
+    result = {**NOMINAL_RESULT, 'metrics': {**NOMINAL_RESULT['metrics'], 'head_movement_normalized': None}}
+    built = _build_response(result)
+    
+    assert built.frame_confidence == 0.812
+    assert built.confidence_status == "PASS"
+    assert built.attention == 55.5
+    assert built.head_movement is None
+    assert built.shoulder_tilt == 3.1
+    assert built.hand_activity == 0.1235
+    assert built.hands_detected == 2
+    assert built.timestamp == 1700000000.5